@@ -1,24 +1,37 @@
 import streamlit as st
-import PyPDF2
-import io
 import base64
-from PIL import Image
+import hashlib
+import fitz
 import os
 from datetime import datetime
 from anthropic import Anthropic
 
-# Initialize the Anthropic client
-anthropic = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+# Month the newsletter is being generated for, computed once per script run
+_CURRENT_MONTH = datetime.now().strftime("%B %Y")
 
-def extract_text_from_pdf(pdf_file):
+# Dynamic tail of the generation prompt
+_REQUEST_PROMPT_TEMPLATE = """This edition of the newsletter is for {current_month}.
+
+Here are the events and updates to include in the new newsletter:
+{events_description}
+
+Please write the complete new newsletter content following these instructions. Provide only the newsletter text content without any meta information or formatting marks."""
+
+@st.cache_resource
+def get_client():
+    """
+    Create the Anthropic client once per process and reuse it across reruns.
+    """
+    return Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def extract_text_from_pdf(pdf_bytes: bytes):
     """
     Extract text content from uploaded PDF while preserving headers and footers.
     """
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
-    text_content = ""
-    
-    for page in pdf_reader.pages:
-        text_content += page.extract_text() + "\n"
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    text_content = "\n".join(page.get_text("text") for page in doc)
+    doc.close()
     
     return text_content
 
@@ -26,10 +39,10 @@ def process_image(image_file):
     """
     Process uploaded image file and convert to base64 for API submission.
     """
-    image = Image.open(image_file)
-    buffered = io.BytesIO()
-    image.save(buffered, format=image.format)
-    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+    # The upload is already an encoded PNG/JPEG, so send its bytes as-is
+    raw = image_file.getvalue()
+    image_file.seek(0)
+    return base64.b64encode(raw).decode('utf-8')
 
 def extract_text_from_response(response):
     """
@@ -49,16 +62,63 @@ def extract_text_from_response(response):
             return str(response.content)
     return str(response)
 
-def generate_new_content(original_text, events_description, images):
+def extract_style_summary(original_text):
+    """
+    Condense the previous newsletter into a short style guide using a fast model.
+    The summary is kept in session state so regenerations reuse it until a
+    different newsletter is uploaded. Falls back to the full newsletter text if
+    the summary cannot be produced.
+    """
+    text_hash = hashlib.sha1(original_text.encode('utf-8')).hexdigest()
+    if st.session_state.get('style_summary_key') == text_hash:
+        return st.session_state.style_summary
+    
+    try:
+        response = get_client().messages.create(
+            model="claude-haiku-4-5",
+            max_tokens=512,
+            temperature=0,
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"""Describe the writing style of the newsletter below as a compact style guide for writing future editions. Cover only the tone, the section headers, and the formatting conventions. Do not mention any specific events. Use 200 words at most.
+
+{original_text}"""
+                }
+            ]
+        )
+        style_summary = extract_text_from_response(response).strip()
+    except Exception:
+        style_summary = ""
+    
+    # Send the whole newsletter rather than blocking generation on the summary
+    if not style_summary:
+        return original_text
+    
+    st.session_state.style_summary = style_summary
+    st.session_state.style_summary_key = text_hash
+    return style_summary
+
+def hash_images(images):
+    """
+    Compute a stable cache key for a list of uploaded image files.
+    """
+    # Hash each file separately so image boundaries and media types are part of the key
+    return hashlib.sha1(b"".join(
+        hashlib.sha1(image.getvalue()).digest() + image.type.encode('utf-8')
+        for image in images
+    )).hexdigest()
+
+def generate_new_content(style_summary, events_description, current_month, images):
     """
     Generate new newsletter content using Claude API, incorporating image descriptions
     and ensuring content references the provided images.
+
+    Yields the response text in chunks as Claude streams it.
     """
-    current_month = datetime.now().strftime("%B %Y")
-    
     # Create image descriptions for the prompt
     image_descriptions = []
-    for idx, image in enumerate(images, 1):
+    for image in images:
         image_b64 = process_image(image)
         image_descriptions.append({
             "type": "image",
@@ -69,27 +129,32 @@ def generate_new_content(original_text, events_description, images):
             }
         })
     
-    text_content = f"""You are tasked with writing a new edition of the Dahlia Wood newsletter for {current_month}. 
+    # Cache breakpoint after the last image so regenerations reuse the image tokens
+    image_descriptions[-1]["cache_control"] = {"type": "ephemeral"}
+    
+    # Static prompt content goes first so it can be served from the prompt cache;
+    # the month and events change between requests and are sent last.
+    style_content = f"""You are tasked with writing a new edition of the Dahlia Wood newsletter.
 
 I have provided you with {len(images)} images that will be included in the newsletter, along with new events to feature.
 
-Please examine this previous newsletter to understand the tone, style, and formatting conventions:
-{original_text}
-
-Here are the events and updates to include in the new newsletter:
-{events_description}
+Please examine this style reference from a previous newsletter to match its tone, style, and formatting conventions:
+{style_summary}
 
 Important instructions:
 1. Create entirely new content - this is a new edition, not an update of the old one
-2. Only include events and information from the description provided above
+2. Only include events and information from the description provided below
 3. Do not reference or include any events from the previous newsletter
 4. You must incorporate natural references to the provided images in your content, as these will be included in the final newsletter
-5. Maintain the same professional tone, style, and structural elements (like headers and section titles) as the original
+5. Maintain the same professional tone, style, and structural elements (like headers and section titles) shown in the style reference
 6. Ensure all Dahlia Wood branding elements and formatting remain consistent
-7. The newsletter should be dated {current_month}
-8. When referencing images, use natural language that will make sense when the images are placed in the final layout (e.g., "As shown in the photograph above...")
+7. The newsletter should be dated with the month given below
+8. When referencing images, use natural language that will make sense when the images are placed in the final layout (e.g., "As shown in the photograph above...")"""
 
-Please write the complete new newsletter content following these instructions. Provide only the newsletter text content without any meta information or formatting marks."""
+    request_content = _REQUEST_PROMPT_TEMPLATE.format(
+        current_month=current_month,
+        events_description=events_description
+    )
 
     # Combine text content with image descriptions for the API call
     messages = [
@@ -103,21 +168,25 @@ Please write the complete new newsletter content following these instructions. P
                 *image_descriptions,
                 {
                     "type": "text",
-                    "text": text_content
+                    "text": style_content,
+                    "cache_control": {"type": "ephemeral"}
+                },
+                {
+                    "type": "text",
+                    "text": request_content
                 }
             ]
         }
     ]
 
-    response = anthropic.messages.create(
-        model="claude-3-sonnet-20240229",
+    with get_client().messages.stream(
+        model="claude-sonnet-4-5",
         max_tokens=2048,
         temperature=0.7,
         system="You are a business communication expert who specializes in writing newsletters while maintaining consistent organizational voice and branding. You should analyze the provided images and incorporate natural references to them in your newsletter content.",
         messages=messages
-    )
-    
-    return extract_text_from_response(response)
+    ) as stream:
+        yield from stream.text_stream
 
 def main():
     st.set_page_config(page_title="Dahlia Wood Newsletter Generator")
@@ -126,10 +195,14 @@ def main():
     # Initialize session state for content and clipboard
     if 'generated_content' not in st.session_state:
         st.session_state.generated_content = None
+    if 'content_cache' not in st.session_state:
+        st.session_state.content_cache = {}
+    if 'style_summary' not in st.session_state:
+        st.session_state.style_summary = None
+        st.session_state.style_summary_key = None
     
     # Add current month display
-    current_month = datetime.now().strftime("%B %Y")
-    st.write(f"Generating newsletter for: {current_month}")
+    st.write(f"Generating newsletter for: {_CURRENT_MONTH}")
     
     # File uploads
     uploaded_pdf = st.file_uploader(
@@ -159,16 +232,46 @@ def main():
     )
     
     if uploaded_pdf is not None and uploaded_images:
-        # Generate content button
-        if st.button("Generate New Content"):
+        # Generate content buttons; Regenerate skips drafts cached for the same inputs
+        generate_col, regenerate_col = st.columns(2)
+        generate_clicked = generate_col.button("Generate New Content")
+        regenerate_clicked = regenerate_col.button(
+            "Regenerate",
+            help="Write a fresh draft instead of reusing one generated earlier for the same inputs"
+        )
+        
+        if generate_clicked or regenerate_clicked:
             with st.spinner("Analyzing images and generating newsletter content..."):
                 try:
-                    original_text = extract_text_from_pdf(uploaded_pdf)
-                    generated_content = generate_new_content(
-                        original_text, 
-                        events_description, 
-                        uploaded_images
+                    original_text = extract_text_from_pdf(uploaded_pdf.getvalue())
+                    style_summary = extract_style_summary(original_text)
+                    # Reuse earlier drafts for identical inputs instead of calling Claude again
+                    cache_key = (
+                        style_summary,
+                        events_description,
+                        _CURRENT_MONTH,
+                        hash_images(uploaded_images)
                     )
+                    if regenerate_clicked:
+                        st.session_state.content_cache.pop(cache_key, None)
+                    generated_content = st.session_state.content_cache.get(cache_key)
+                    if generated_content is not None:
+                        st.caption("Showing the draft generated earlier for these inputs. Click Regenerate for a new one.")
+                    else:
+                        # Stream the draft so it renders while Claude is still writing
+                        placeholder = st.empty()
+                        try:
+                            with placeholder:
+                                generated_content = st.write_stream(generate_new_content(
+                                    style_summary, 
+                                    events_description, 
+                                    _CURRENT_MONTH,
+                                    uploaded_images
+                                ))
+                        finally:
+                            # The finished content is shown in the editable text area instead
+                            placeholder.empty()
+                        st.session_state.content_cache[cache_key] = generated_content
                     st.session_state.generated_content = generated_content
                 except Exception as e:
                     st.error(f"Error generating content: {str(e)}")